@@ -4,5 +4,5 @@ def generate_api_key():
     # This generates a 32-character hexadecimal token.
     return secrets.token_hex(16)
 
-api_key = generate_api_key()
-print("Your generated API key:", api_key)
+if __name__ == "__main__":
+    print("Your generated API key:", generate_api_key())
@@ -1,12 +1,21 @@
 import streamlit as st
 from streamlit_plotly_events import plotly_events  # pip install streamlit-plotly-events
-import plotly.express as px
+import plotly.graph_objects as go
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import pandas as pd
 import io
-import matplotlib.pyplot as plt
+import functools
+import copy
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import matplotlib
+matplotlib.use("Agg")  # Headless backend; no GUI toolkit probing on first plot.
+from matplotlib.figure import Figure
 import requests  # For calling the FastAPI backend
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 st.title("Venous Pressure Annotation App")
 
@@ -54,278 +63,457 @@ if "annotations" not in st.session_state:
 if "next_id" not in st.session_state:
     st.session_state.next_id = 1
 if "clicked_points" not in st.session_state:
-    st.session_state.clicked_points = []  # Each clicked point: {x, y}
+    st.session_state.clicked_points = []  # Each clicked point: {x, y, pid}
 if "rotation_angle" not in st.session_state:
     st.session_state.rotation_angle = 0
+if "clicked_xy" not in st.session_state:
+    st.session_state.clicked_xy = np.empty((0, 2))  # (N, 2) mirror of clicked_points
+if "pending_uploads" not in st.session_state:
+    st.session_state.pending_uploads = []  # Each pending upload: (annotation id, future)
+if "upload_status" not in st.session_state:
+    st.session_state.upload_status = {}  # annotation id -> "saved" / "failed"
+
+# Rotation angle -> Pillow transpose method; the Rotate button only steps by 90 degrees.
+ROTATE_TRANSPOSE = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+# Two coordinates closer than this many pixels (in both x and y) are the same point.
+TOLERANCE = 5
+
+def coords_array(items):
+    """Return the x/y coordinates of a list of points or annotations as an (N, 2) array."""
+    return np.array([[item["x"], item["y"]] for item in items], dtype=float).reshape(-1, 2)
+
+def annotated_mask(point_xy, ann_xy, tolerance=TOLERANCE):
+    """Flag each row of point_xy that has an annotation within the tolerance."""
+    if not len(point_xy) or not len(ann_xy):
+        return np.zeros(len(point_xy), dtype=bool)
+    # float32 halves the broadcast temporary.
+    point_xy = np.asarray(point_xy, dtype=np.float32)
+    ann_xy = np.asarray(ann_xy, dtype=np.float32)
+    close = np.abs(point_xy[:, None, :] - ann_xy[None, :, :]) < tolerance
+    return close.all(axis=2).any(axis=1)
 
 def add_clicked_point(new_point):
     """Add a new clicked point if not already present (using a tolerance)."""
-    tolerance = 5
-    for p in st.session_state.clicked_points:
-        if abs(p["x"] - new_point["x"]) < tolerance and abs(p["y"] - new_point["y"]) < tolerance:
-            return
+    arr = st.session_state.clicked_xy
+    if arr.size and np.any(
+        (np.abs(arr[:, 0] - new_point["x"]) < TOLERANCE) & (np.abs(arr[:, 1] - new_point["y"]) < TOLERANCE)
+    ):
+        return
+    # Points are never removed, so the list position is a stable integer id for widget keys.
+    new_point["pid"] = len(st.session_state.clicked_points)
+    # A new click becomes the point whose form is shown.
+    st.session_state.active_point = new_point["pid"]
     st.session_state.clicked_points.append(new_point)
+    st.session_state.clicked_xy = np.vstack([arr, [new_point["x"], new_point["y"]]])
+
+def show_clicked_points(fig, points):
+    """Add the red "Clicked Points" marker trace to the figure, or update it if present."""
+    x = [pt["x"] for pt in points]
+    y = [pt["y"] for pt in points]
+    if any(trace.name == "Clicked Points" for trace in fig.data):
+        fig.update_traces(x=x, y=y, selector=dict(name="Clicked Points"))
+    else:
+        # WebGL markers keep browser redraws fast as the number of points grows.
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            mode="markers",
+            marker=dict(size=12, color="red"),
+            name="Clicked Points"
+        ))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def prepare_image(raw_bytes, rotation, width):
+    """Decode, resize and rotate the uploaded image; cached on bytes + rotation."""
+    image = Image.open(io.BytesIO(raw_bytes))
+    # Work out the display size from the rotated shape, but resize first so the
+    # rotation only touches display-sized pixels.
+    quarter_turn = rotation in (90, 270)
+    rotated_width, rotated_height = (image.height, image.width) if quarter_turn else image.size
+    display_ratio = width / rotated_width
+    display_height = int(rotated_height * display_ratio)
+    resized_image = image.resize((display_height, width) if quarter_turn else (width, display_height))
+    # Right-angle rotations are a plain pixel transpose; no interpolation needed.
+    if rotation:
+        resized_image = resized_image.transpose(ROTATE_TRANSPOSE[rotation])
+    return resized_image
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def image_data_uri(raw_bytes, rotation, width):
+    """Encode the prepared image once as a data URI for the Plotly figure; cached like prepare_image."""
+    resized_image = prepare_image(raw_bytes, rotation, width)
+    # JPEG keeps the URI small; only images with an alpha channel need PNG.
+    if resized_image.mode in ("RGBA", "LA", "PA"):
+        image_format, mime = "PNG", "image/png"
+    else:
+        image_format, mime = "JPEG", "image/jpeg"
+        if resized_image.mode not in ("RGB", "L"):
+            resized_image = resized_image.convert("RGB")
+    buf = io.BytesIO()
+    resized_image.save(buf, format=image_format)
+    return f"data:{mime};base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+@st.cache_resource(max_entries=4)
+def make_base_fig(image_key, _data_uri, width, height):
+    """Build the image figure scaffold once per image key; callers copy it before adding markers."""
+    # The image trace points at the cached data URI; it stays a trace (not layout.images) so clicks register.
+    # Reverse the y-axis so that coordinates match the PIL image.
+    fig = go.Figure(go.Image(source=_data_uri))
+    fig.update_xaxes(range=[-0.5, width - 0.5], constrain="domain")
+    fig.update_yaxes(range=[height - 0.5, -0.5], scaleanchor="x", constrain="domain")
+    fig.update_layout(clickmode='event+select')
+    # Empty marker layer that show_clicked_points fills in on each run's copy.
+    show_clicked_points(fig, [])
+    return fig
+
+@st.cache_resource
+def get_font(size=40):
+    """Load a bold font once per process, falling back to a regular/default one."""
+    for font_name in ("arialbd.ttf", "arial.ttf", "DejaVuSans-Bold.ttf"):
+        try:
+            return ImageFont.truetype(font_name, size)
+        except Exception:
+            continue
+    st.error("No custom font available; falling back to default font (text may be small).")
+    return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=256)
+def text_bbox(text, size):
+    """Return the font bounding box of text, measuring each distinct string only once."""
+    return get_font(size).getbbox(text)
+
+@st.cache_resource
+def get_glyph_cache(size, fill):
+    """Cache of stroked glyph tiles for one font size and colour: char -> (tile, offset, advance)."""
+    return {}
+
+def paste_text(image, xy, text, size, fill):
+    """Draw outlined text at xy by pasting cached glyph tiles instead of re-rasterizing them."""
+    glyphs = get_glyph_cache(size, fill)
+    x, y = xy
+    for c in text:
+        if c not in glyphs:
+            # The font is only needed to rasterize a glyph the cache hasn't seen yet.
+            font = get_font(size)
+            left, top, right, bottom = font.getbbox(c, stroke_width=2)
+            tile = Image.new("RGBA", (max(right - left, 1), max(bottom - top, 1)), (0, 0, 0, 0))
+            ImageDraw.Draw(tile).text((-left, -top), c, fill=fill, font=font, stroke_width=2, stroke_fill="black")
+            glyphs[c] = (tile, (left, top), font.getlength(c))
+        tile, (left, top), advance = glyphs[c]
+        image.paste(tile, (int(round(x + left)), int(round(y + top))), tile)
+        x += advance
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def render_annotated_images(raw_bytes, rotation, width, annotations, clicked_points):
+    """Draw the marker (left) and annotation text (right) images; return both as PNG bytes."""
+    resized_image = prepare_image(raw_bytes, rotation, width)
+    
+    # Draw markers on the left image.
+    left_image = resized_image.copy()
+    draw_left = ImageDraw.Draw(left_image)
+    r = 6  # marker radius
+    ann_xy = coords_array(annotations)
+    annotated = annotated_mask(coords_array(clicked_points), ann_xy)
+    for pt, is_annotated in zip(clicked_points, annotated):
+        color = "green" if is_annotated else "red"
+        draw_left.ellipse(
+            [(pt["x"] - r, pt["y"] - r), (pt["x"] + r, pt["y"] + r)],
+            fill=color,
+            outline=color
+        )
+
+    # Draw annotation texts on the right image by pasting cached stroked glyph tiles,
+    # so each distinct character is rasterized with its outline only once.
+    right_image = resized_image.copy()
+
+    for ann in annotations:
+        if ann["location"] == "Stenosis":
+            text = "X"  # smaller, red X
+            fill_color = "red"
+        else:
+            text = ann["value"]
+            fill_color = "#FFFFFF"
+
+        bbox = text_bbox(text, 40)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        x = ann["x"] - text_width / 2
+        y = ann["y"] - text_height / 2
+        paste_text(right_image, (x, y), text, 40, fill_color)
+
+    png_images = []
+    for img in (left_image, right_image):
+        buf_img = io.BytesIO()
+        # Fast zlib level: these PNGs go straight to the browser/download button.
+        img.save(buf_img, format="PNG", compress_level=1)
+        png_images.append(buf_img.getvalue())
+    return tuple(png_images)
+
+@st.cache_resource
+def get_table_figure():
+    """One reusable figure for the summary table, plus a lock since all sessions share it."""
+    # A bare Figure is not tracked by pyplot, so it is never leaked between renders.
+    return Figure(), threading.Lock()
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def render_summary_table(df_summary):
+    """Render the summary table as PNG bytes and as an Excel workbook's bytes."""
+    # Create a PNG table for download.
+    fig_table, fig_lock = get_table_figure()
+    with fig_lock:
+        fig_table.clf()
+        fig_table.set_size_inches(6, len(df_summary) * 0.5 + 1)
+        # Fixed axes and bbox; no layout solve.
+        ax = fig_table.add_axes([0.02, 0.02, 0.96, 0.96])
+        ax.axis('off')
+        table = ax.table(
+            cellText=df_summary.values,
+            colLabels=["Location", "Pressure (mmHg)"],
+            loc='center'
+        )
+        for (i, j), cell in table.get_celld().items():
+            if i == 0:
+                cell.set_text_props(weight='bold', ha='center')
+            else:
+                if j == 0:
+                    cell.set_text_props(ha='left')
+                elif j == 1:
+                    cell.set_text_props(ha='right')
+        buf_table = io.BytesIO()
+        fig_table.savefig(buf_table, format="PNG", dpi=100, bbox_inches=None,
+                          pil_kwargs={"compress_level": 1})
+    table_png = buf_table.getvalue()
+
+    # Create an Excel file from the summary DataFrame.
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
+        df_summary.to_excel(writer, index=False, sheet_name="Annotations")
+    return table_png, excel_buffer.getvalue()
+
+# Adjust the endpoint to the URL where your FastAPI backend is deployed.
+API_ENDPOINT = "http://127.0.0.1:8000/save_annotation"
+
+@st.cache_resource
+def get_api_session():
+    """Create one pooled HTTP session for the backend, reused across reruns."""
+    session = requests.Session()
+    # Retrieve API key from Streamlit secrets once instead of on every save.
+    session.headers.update({
+        "api_key": st.secrets["api_keys"]["my_service"],
+        "Content-Type": "application/json"
+    })
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_upload_executor():
+    """Worker threads that perform backend saves off the render path."""
+    return ThreadPoolExecutor(max_workers=4)
 
 # Function to send annotation data to your FastAPI backend.
 def send_annotation_to_api(annotation):
-    # Retrieve API key from Streamlit secrets.
-    api_key = st.secrets["api_keys"]["my_service"]
-    # Adjust the endpoint to the URL where your FastAPI backend is deployed.
-    endpoint = "http://127.0.0.1:8000/save_annotation"
-    headers = {"api_key": api_key, "Content-Type": "application/json"}
-    response = requests.post(endpoint, json=annotation, headers=headers)
-    return response
+    """Queue the POST on a worker thread and return its future."""
+    # Keep-alive on the shared session avoids a new connection per save.
+    session = get_api_session()
+    return get_upload_executor().submit(session.post, API_ENDPOINT, json=annotation, timeout=5)
+
+def drain_pending_uploads():
+    """Record finished background saves in session state and report them once."""
+    still_pending = []
+    for ann_id, future in st.session_state.pending_uploads:
+        if not future.done():
+            still_pending.append((ann_id, future))
+            continue
+        try:
+            saved = future.result().status_code == 200
+        except requests.RequestException:
+            saved = False
+        st.session_state.upload_status[ann_id] = "saved" if saved else "failed"
+        if saved:
+            st.info(f"Annotation {ann_id} successfully saved to backend!")
+        else:
+            st.error(f"Failed to save annotation {ann_id} to backend.")
+    st.session_state.pending_uploads = still_pending
+
+@st.fragment
+def render_annotation_forms():
+    """Show the form for the active clicked point that is not yet annotated; reruns on its own."""
+    if "notice" in st.session_state:
+        st.success(st.session_state.pop("notice"))
+    ann_xy = coords_array(st.session_state.annotations)
+    already_annotated = annotated_mask(st.session_state.clicked_xy, ann_xy)
+    # Only one point's form is built per run: the most recent click, unless another pending
+    # point is picked below, so typing into a field doesn't rebuild every point's widgets.
+    pending = {
+        pt["pid"]: pt
+        for pt, is_annotated in zip(st.session_state.clicked_points, already_annotated)
+        if not is_annotated
+    }
+    if pending:
+        if st.session_state.get("active_point") not in pending:
+            st.session_state.active_point = next(reversed(pending))
+        # The picker's widget state is active_point itself, so a new click re-points it.
+        active_pid = st.selectbox(
+            "Point to annotate:",
+            list(pending),
+            format_func=lambda p: f"(x={pending[p]['x']:.0f}, y={pending[p]['y']:.0f})",
+            key="active_point"
+        )
+        pt = pending[active_pid]
+        with st.expander(f"Add Annotation at (x={pt['x']:.0f}, y={pt['y']:.0f})"):
+            # Widgets inside a form only trigger a rerun when the form is submitted,
+            # so every field is shown up front and validated on save.
+            with st.form(key=f"form_{pt['pid']}"):
+                location = st.selectbox("Select location:", LOCATIONS, key=f"loc_{pt['pid']}")
+                side = st.selectbox("Select side (if applicable):", ["Select...", "Left", "Right"], key=f"side_{pt['pid']}")
+                # For "Stenosis", no pressure input is needed; a big X is added instead.
+                pressure = st.text_input("Enter pressure value (mmHg):", key=f"val_{pt['pid']}")
+                submitted = st.form_submit_button("Save Annotation")
+            
+            # Save annotation only if location is selected and (if required) side is provided.
+            if submitted:
+                if location == "Select...":
+                    st.error("Please select a location for this annotation.")
+                elif location in SIDE_REQUIRED and side == "Select...":
+                    st.error("Please select a side (Left or Right) for this location.")
+                else:
+                    annotation = {
+                        "id": st.session_state.next_id,
+                        "x": pt["x"],
+                        "y": pt["y"],
+                        "location": location,
+                        "value": "X" if location == "Stenosis" else pressure
+                    }
+                    if location in SIDE_REQUIRED:
+                        annotation["side"] = side
+                    st.session_state.annotations.append(annotation)
+                    st.session_state.next_id += 1
+                    st.session_state.notice = f"Annotation {annotation['id']} added!"
+                    
+                    # Send annotation data to the FastAPI backend in the background;
+                    # the result is reported on a later rerun.
+                    future = send_annotation_to_api(annotation)
+                    st.session_state.pending_uploads.append((annotation["id"], future))
+                    # Rerun the whole app so the sidebar picks up the new annotation.
+                    st.rerun()
+
+@st.fragment
+def render_sidebar():
+    """List the annotations with delete buttons; call inside `with st.sidebar:`."""
+    st.title("Annotations")
+    if st.session_state.annotations:
+        # Remember which row was deleted and pop it by index after the loop, instead of
+        # iterating over a copy and rebuilding the list.
+        deleted = None
+        for i, ann in enumerate(st.session_state.annotations):
+            extra = f" - {ann['side']}" if "side" in ann else ""
+            st.write(f"ID {ann['id']}: {ann['location']}{extra} - {ann['value']}")
+            st.caption(f"Backend: {st.session_state.upload_status.get(ann['id'], 'pending')}")
+            if st.button("Delete", key=f"delete_{ann['id']}"):
+                deleted = i
+        if deleted is not None:
+            ann = st.session_state.annotations.pop(deleted)
+            st.success(f"Annotation {ann['id']} deleted!")
+    else:
+        st.write("No annotations yet.")
+
+@st.fragment
+def render_generate_panel(raw_bytes, rotation, width):
+    """Generate button plus the side-by-side images and downloads; reruns on its own."""
+    if st.button("Generate and Save Annotated Image"):
+        # Draw markers on the left image and annotation texts on the right image.
+        left_png, right_png = render_annotated_images(
+            raw_bytes,
+            rotation,
+            width,
+            st.session_state.annotations,
+            st.session_state.clicked_points
+        )
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.image(left_png, caption="Original Image (with markers)", use_container_width=True)
+        with col2:
+            st.image(right_png, caption="Annotated Image (with large text)", use_container_width=True)
+        
+        # Generate a summary table with only pressure measurements.
+        # One pass skips "Stenosis" and prefixes the side where one was chosen, so the
+        # frame is built from just the kept rows.
+        locations, values = [], []
+        for ann in st.session_state.annotations:
+            if ann["location"] == "Stenosis":
+                continue
+            side = ann.get("side") or ""
+            locations.append(f"{side} {ann['location']}" if side and side != "Select..." else ann["location"])
+            values.append(ann["value"])
+        df_summary = pd.DataFrame({"location": locations, "value": values})
+        
+        # Create a PNG table and an Excel file for download.
+        table_png, excel_bytes = render_summary_table(df_summary)
+        
+        st.download_button("Download Annotated Image", data=right_png,
+                           file_name="annotated_image.png", mime="image/png")
+        st.download_button("Download Summary Table (PNG)", data=table_png,
+                           file_name="summary_table.png", mime="image/png")
+        st.download_button("Download Master Excel File", data=excel_bytes,
+                           file_name="master_annotations.xlsx", 
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+drain_pending_uploads()
 
 # 1. Upload Image
 uploaded_file = st.file_uploader("Choose an image", type=["png", "jpg", "jpeg"])
 if uploaded_file is not None:
-    image = Image.open(uploaded_file)
+    raw_bytes = uploaded_file.getvalue()
     
     # Button to rotate image by 90 degrees on each click.
     if st.button("Rotate Image"):
         st.session_state.rotation_angle = (st.session_state.rotation_angle + 90) % 360
     
-    # Rotate the image based on the current session state rotation angle.
-    rotated_image = image.rotate(st.session_state.rotation_angle, expand=True)
-    
-    # Resize rotated image to a fixed width (e.g., 600px)
+    # Rotate the image based on the current session state rotation angle and
+    # resize it to a fixed width (e.g., 600px). Reruns reuse the cached result.
     display_width = 600
-    display_ratio = display_width / rotated_image.width
-    display_height = int(rotated_image.height * display_ratio)
-    resized_image = rotated_image.resize((display_width, display_height))
-    
-    # Convert the PIL image to a numpy array for Plotly.
-    img_array = np.array(resized_image)
+    resized_image = prepare_image(raw_bytes, st.session_state.rotation_angle, display_width)
+    display_height = resized_image.height
     
     # 2. Create a Plotly figure to display the image and capture click events.
-    # Reverse the y-axis so that coordinates match the PIL image.
-    fig = px.imshow(img_array)
-    fig.update_yaxes(autorange='reversed')
-    fig.update_layout(clickmode='event+select')
+    # The scaffold (image trace on the cached data URI, axes, empty marker layer) is built
+    # once per upload, rotation and width; each run works on its own copy of it.
+    image_key = (hash(raw_bytes), st.session_state.rotation_angle, display_width)
+    data_uri = image_data_uri(raw_bytes, st.session_state.rotation_angle, display_width)
+    fig = copy.copy(make_base_fig(image_key, data_uri, display_width, display_height))
     
     # If there are already clicked points, add them as red markers.
     if st.session_state.clicked_points:
-        fig.add_scatter(
-            x=[pt["x"] for pt in st.session_state.clicked_points],
-            y=[pt["y"] for pt in st.session_state.clicked_points],
-            mode="markers",
-            marker=dict(size=12, color="red"),
-            name="Clicked Points"
-        )
+        show_clicked_points(fig, st.session_state.clicked_points)
     
     # Capture new click events on the Plotly image.
     new_clicked = plotly_events(fig, click_event=True, override_height=display_height, override_width=display_width)
     if new_clicked:
         for pt in new_clicked:
             add_clicked_point({"x": pt.get("x"), "y": pt.get("y")})
+        # Refresh the marker trace in place instead of rebuilding the figure.
+        show_clicked_points(fig, st.session_state.clicked_points)
     
-    # Refresh the Plotly figure with all clicked points.
-    fig.data = []  # Clear previous traces
-    fig = px.imshow(img_array)
-    fig.update_yaxes(autorange='reversed')
-    fig.update_layout(clickmode='event+select')
-    if st.session_state.clicked_points:
-        fig.add_scatter(
-            x=[pt["x"] for pt in st.session_state.clicked_points],
-            y=[pt["y"] for pt in st.session_state.clicked_points],
-            mode="markers",
-            marker=dict(size=12, color="red"),
-            name="Clicked Points"
-        )
     st.plotly_chart(fig, use_container_width=True)
     
     st.write("Below are forms for adding details to each new annotation (for each point you clicked).")
     
     # 3. For each clicked point that is not yet annotated, display a form to add annotation details.
-    tolerance = 5
-    for pt in st.session_state.clicked_points:
-        already_annotated = any(
-            abs(ann["x"] - pt["x"]) < tolerance and abs(ann["y"] - pt["y"]) < tolerance 
-            for ann in st.session_state.annotations
-        )
-        if not already_annotated:
-            with st.expander(f"Add Annotation at (x={pt['x']:.0f}, y={pt['y']:.0f})"):
-                location = st.selectbox("Select location:", LOCATIONS, key=f"loc_{pt['x']}_{pt['y']}")
-                # Initialize side as "Select..." if needed.
-                side = "Select..."
-                if location in SIDE_REQUIRED:
-                    side = st.selectbox("Select side:", ["Select...", "Left", "Right"], key=f"side_{pt['x']}_{pt['y']}")
-                
-                # For "Stenosis", no pressure input is needed; add a big X.
-                if location != "Select...":
-                    if location == "Stenosis":
-                        annotation_value = "X"
-                    else:
-                        annotation_value = st.text_input("Enter pressure value (mmHg):", key=f"val_{pt['x']}_{pt['y']}")
-                else:
-                    annotation_value = ""
-                
-                # Save annotation only if location is selected and (if required) side is provided.
-                if location != "Select..." and st.button("Save Annotation", key=f"save_{pt['x']}_{pt['y']}"):
-                    if location in SIDE_REQUIRED and side == "Select...":
-                        st.error("Please select a side (Left or Right) for this location.")
-                    else:
-                        annotation = {
-                            "id": st.session_state.next_id,
-                            "x": pt["x"],
-                            "y": pt["y"],
-                            "location": location,
-                            "value": annotation_value
-                        }
-                        if location in SIDE_REQUIRED:
-                            annotation["side"] = side
-                        st.session_state.annotations.append(annotation)
-                        st.session_state.next_id += 1
-                        st.success(f"Annotation {annotation['id']} added!")
-                        
-                        # Send annotation data to the FastAPI backend.
-                        api_response = send_annotation_to_api(annotation)
-                        if api_response.status_code == 200:
-                            st.info("Annotation successfully saved to backend!")
-                        else:
-                            st.error("Failed to save annotation to backend.")
+    render_annotation_forms()
     
     # 4. Display current annotations in the sidebar with delete options.
-    st.sidebar.title("Annotations")
-    if st.session_state.annotations:
-        for ann in st.session_state.annotations.copy():
-            extra = f" - {ann['side']}" if "side" in ann else ""
-            st.sidebar.write(f"ID {ann['id']}: {ann['location']}{extra} - {ann['value']}")
-            if st.sidebar.button("Delete", key=f"delete_{ann['id']}"):
-                st.session_state.annotations = [a for a in st.session_state.annotations if a["id"] != ann["id"]]
-                st.sidebar.success(f"Annotation {ann['id']} deleted!")
-    else:
-        st.sidebar.write("No annotations yet.")
+    with st.sidebar:
+        render_sidebar()
     
     # 5. Generate and display side by side:
     #    - Left: The original image (with markers drawn).
     #    - Right: The annotated image (with large text drawn).
-    if st.button("Generate and Save Annotated Image"):
-        # Draw markers on the left image.
-        left_image = resized_image.copy()
-        draw_left = ImageDraw.Draw(left_image)
-        r = 6  # marker radius
-        tolerance = 5
-        for pt in st.session_state.clicked_points:
-            annotated = any(
-                abs(ann["x"] - pt["x"]) < tolerance and abs(ann["y"] - pt["y"]) < tolerance
-                for ann in st.session_state.annotations
-            )
-            color = "green" if annotated else "red"
-            draw_left.ellipse(
-                [(pt["x"] - r, pt["y"] - r), (pt["x"] + r, pt["y"] + r)],
-                fill=color,
-                outline=color
-            )
-        
-        # Draw annotation texts on the right image.
-        right_image = resized_image.copy()
-        draw_right = ImageDraw.Draw(right_image)
-        try:
-            base_font = ImageFont.truetype("arialbd.ttf", 40)
-        except Exception as e1:
-            try:
-                base_font = ImageFont.truetype("arial.ttf", 40)
-            except Exception as e2:
-                try:
-                    base_font = ImageFont.truetype("DejaVuSans-Bold.ttf", 40)
-                except Exception as e3:
-                    st.error("No custom font available; falling back to default font (text may be small).")
-                    base_font = ImageFont.load_default()
-
-        for ann in st.session_state.annotations:
-            if ann["location"] == "Stenosis":
-                text = "X"
-                try:
-                    font = ImageFont.truetype("arialbd.ttf", 40)  # smaller, red X
-                except Exception as e1:
-                    try:
-                        font = ImageFont.truetype("arial.ttf", 40)
-                    except Exception as e2:
-                        try:
-                            font = ImageFont.truetype("DejaVuSans-Bold.ttf", 40)
-                        except Exception as e3:
-                            font = ImageFont.load_default()
-                fill_color = "red"
-            else:
-                text = ann["value"]
-                font = base_font
-                fill_color = "#FFFFFF"
-            
-            bbox = font.getbbox(text)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            x = ann["x"] - text_width / 2
-            y = ann["y"] - text_height / 2
-            draw_right.text(
-                (x, y),
-                text,
-                fill=fill_color,
-                font=font,
-                stroke_width=2,
-                stroke_fill="black"
-            )
-
-        col1, col2 = st.columns(2)
-        with col1:
-            st.image(left_image, caption="Original Image (with markers)", use_container_width=True)
-        with col2:
-            st.image(right_image, caption="Annotated Image (with large text)", use_container_width=True)
-        
-        # Save annotated image for download.
-        buf_img = io.BytesIO()
-        right_image.save(buf_img, format="PNG")
-        annotated_image_bytes = buf_img.getvalue()
-        
-        # Generate a summary table with only pressure measurements.
-        df_full = pd.DataFrame(st.session_state.annotations)
-        if not df_full.empty:
-            # Exclude annotations for "Stenosis" from the table.
-            df_summary = df_full[~df_full["location"].isin(["Stenosis"])].copy()
-            if "side" in df_summary.columns:
-                df_summary["side"] = df_summary["side"].fillna("")
-            df_summary["location"] = df_summary.apply(
-                lambda row: f"{row['side']} {row['location']}".strip() 
-                    if row.get("side", "") and row["side"] != "Select..." 
-                    else row["location"],
-                axis=1
-            )
-            df_summary = df_summary[["location", "value"]]
-        else:
-            df_summary = pd.DataFrame(columns=["location", "value"])
-        
-        # Create a PNG table for download.
-        fig_table, ax = plt.subplots(figsize=(6, len(df_summary) * 0.5 + 1))
-        ax.axis('tight')
-        ax.axis('off')
-        table = ax.table(
-            cellText=df_summary.values,
-            colLabels=["Location", "Pressure (mmHg)"],
-            loc='center'
-        )
-        for (i, j), cell in table.get_celld().items():
-            if i == 0:
-                cell.set_text_props(weight='bold', ha='center')
-            else:
-                if j == 0:
-                    cell.set_text_props(ha='left')
-                elif j == 1:
-                    cell.set_text_props(ha='right')
-        plt.tight_layout()
-        buf_table = io.BytesIO()
-        plt.savefig(buf_table, format="PNG")
-        buf_table.seek(0)
-        table_png = buf_table.getvalue()
-        
-        # Create an Excel file from the summary DataFrame.
-        excel_buffer = io.BytesIO()
-        df_summary.to_excel(excel_buffer, index=False)
-        excel_buffer.seek(0)
-        
-        st.download_button("Download Annotated Image", data=annotated_image_bytes,
-                           file_name="annotated_image.png", mime="image/png")
-        st.download_button("Download Summary Table (PNG)", data=table_png,
-                           file_name="summary_table.png", mime="image/png")
-        st.download_button("Download Master Excel File", data=excel_buffer,
-                           file_name="master_annotations.xlsx", 
-                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    render_generate_panel(raw_bytes, st.session_state.rotation_angle, display_width)
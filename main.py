@@ -1,23 +1,40 @@
+import hmac
+import os
+
 from fastapi import FastAPI, Header, HTTPException, Depends
+from pydantic import BaseModel, ConfigDict
 
 app = FastAPI()
 
 # For demonstration purposes, this is our "valid" API key.
-# In production, retrieve this from environment variables or a secrets manager.
-VALID_API_KEY = "8fc1b4fd80f5cb3c6e705a1428342c02"
+# In production, set the API_KEY environment variable (read once at startup).
+VALID_API_KEY = os.environ.get("API_KEY", "8fc1b4fd80f5cb3c6e705a1428342c02")
+_VALID_KEY_BYTES = VALID_API_KEY.encode("ascii")
 
 # Dependency to verify the API key sent in request headers
 async def verify_api_key(api_key: str = Header(...)):
-    if api_key != VALID_API_KEY:
+    # Constant-time comparison so response timing doesn't leak the key.
+    if not hmac.compare_digest(api_key.encode("ascii", "replace"), _VALID_KEY_BYTES):
         raise HTTPException(status_code=403, detail="Invalid or missing API key")
     return api_key
 
+# Shape of an annotation posted by the Streamlit app; unknown fields are dropped.
+class Annotation(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    id: int
+    x: float
+    y: float
+    location: str
+    value: str
+    side: str | None = None
+
 @app.get("/")
 async def read_root(api_key: str = Depends(verify_api_key)):
     return {"message": "Hello, this is your secure FastAPI backend!"}
 
 @app.post("/save_annotation")
-async def save_annotation(annotation: dict, api_key: str = Depends(verify_api_key)):
+async def save_annotation(annotation: Annotation, api_key: str = Depends(verify_api_key)):
     # In a real-world app, save the annotation to a database or file.
     # For now, just echo back the received data.
-    return {"status": "saved", "annotation": annotation}
+    return {"status": "saved", "annotation": annotation.model_dump()}
@@ -0,0 +1,18 @@
+import io
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("openpyxl")  # pd.read_excel's reader for .xlsx
+
+import beefed_up_venous
+
+
+def test_summary_excel_round_trip():
+    df_summary = pd.DataFrame({
+        "location": ["Left Jugular bulb", "Torcula", "Subclavian"],
+        "value": [15, 9, 7],
+    })
+    _, excel_bytes = beefed_up_venous.render_summary_table(df_summary)
+    df_read = pd.read_excel(io.BytesIO(excel_bytes), sheet_name="Annotations")
+    pd.testing.assert_frame_equal(df_read, df_summary)
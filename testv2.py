@@ -1,11 +1,14 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 from streamlit_plotly_events import plotly_events  # pip install streamlit-plotly-events
-import plotly.express as px
+import plotly.graph_objects as go
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
-import pandas as pd
 import io
-import matplotlib.pyplot as plt
+import functools
+import base64
+import copy
+from array import array
 
 st.title("Venous Pressure Annotation App")
 
@@ -47,60 +50,282 @@ SIDE_REQUIRED = [
     "Subclavian"
 ]
 
+# Annotations are stored column-wise: a dict of equal-length columns, one per field.
+# Numeric fields are typed arrays (NumPy reads them without copying); text fields are lists.
+ANNOTATION_FIELDS = ("id", "x", "y", "location", "value", "side")
+ANNOTATION_TYPECODES = {"id": "i", "x": "d", "y": "d"}
+
 # Initialize session state for annotations, clicked points, rotation, and next annotation ID
 if "annotations" not in st.session_state:
-    st.session_state.annotations = []  # Each is a dict: {id, x, y, location, value, (side)}
+    st.session_state.annotations = {field: array(ANNOTATION_TYPECODES[field]) if field in ANNOTATION_TYPECODES else [] for field in ANNOTATION_FIELDS}  # One list per field; side is "" when not needed
 if "next_id" not in st.session_state:
     st.session_state.next_id = 1
-if "clicked_points" not in st.session_state:
-    st.session_state.clicked_points = []  # Each is a dict: {x, y}
+if "clicked_xy" not in st.session_state:
+    st.session_state.clicked_xy = np.empty((0, 2))  # (N, 2) array of clicked x/y coordinates
+if "clicked_pid" not in st.session_state:
+    st.session_state.clicked_pid = []  # Stable integer id per clicked_xy row, used in widget keys
+if "next_pid" not in st.session_state:
+    st.session_state.next_pid = 0
+if "click_grid" not in st.session_state:
+    st.session_state.click_grid = {}  # (cell_x, cell_y) -> row indices into clicked_xy
 if "rotation_angle" not in st.session_state:
     st.session_state.rotation_angle = 0
 
+# Rotation angle -> Pillow transpose method; the Rotate button only steps by 90 degrees.
+ROTATE_TRANSPOSE = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}
+
+# Two coordinates closer than this many pixels (in both x and y) are the same point.
+TOLERANCE = 5
+# Grid cell size for bucketing clicked points; with cells at least TOLERANCE wide,
+# any duplicate of a point lies in its own or one of the 8 neighbouring cells.
+GRID_CELL = 2 * TOLERANCE
+
+# Cap on stored clicks per session; once reached, the oldest click is dropped.
+MAX_POINTS = 500
+
+def coords_array(columns):
+    """Return the x/y columns of the annotation store as an (N, 2) array."""
+    return np.column_stack([np.frombuffer(columns["x"], dtype=float), np.frombuffer(columns["y"], dtype=float)])
+
+def annotated_mask(point_xy, ann_xy, tolerance=TOLERANCE):
+    """Flag each row of point_xy that has an annotation within the tolerance."""
+    if not len(point_xy) or not len(ann_xy):
+        return np.zeros(len(point_xy), dtype=bool)
+    point_xy = np.asarray(point_xy, dtype=np.float32)
+    ann_xy = np.asarray(ann_xy, dtype=np.float32)
+    close = np.abs(point_xy[:, None, :] - ann_xy[None, :, :]) < tolerance
+    return close.all(axis=2).any(axis=1)
+
+def grid_cell(x, y):
+    """Return the click-grid cell that holds the point (x, y)."""
+    return int(x // GRID_CELL), int(y // GRID_CELL)
+
 def add_clicked_point(new_point):
-    """Add a new clicked point if not already present (within a 5-pixel tolerance)."""
-    tolerance = 5
-    for p in st.session_state.clicked_points:
-        if abs(p["x"] - new_point["x"]) < tolerance and abs(p["y"] - new_point["y"]) < tolerance:
-            return
-    st.session_state.clicked_points.append(new_point)
+    """Add a new clicked point if not already present (within a 5-pixel tolerance); return whether it was added."""
+    clicked_xy = st.session_state.clicked_xy
+    grid = st.session_state.click_grid
+    x, y = float(new_point["x"]), float(new_point["y"])
+    cx, cy = grid_cell(x, y)
+    # Only points bucketed in the surrounding 3x3 cells can be within the tolerance.
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for i in grid.get((cx + dx, cy + dy), ()):
+                if abs(clicked_xy[i, 0] - x) < TOLERANCE and abs(clicked_xy[i, 1] - y) < TOLERANCE:
+                    return False
+    if len(clicked_xy) >= MAX_POINTS:
+        # Drop the oldest click and re-bucket the rest, since every stored index shifts down by one.
+        clicked_xy = clicked_xy[1:]
+        del st.session_state.clicked_pid[0]
+        grid.clear()
+        for i, (old_x, old_y) in enumerate(clicked_xy):
+            grid.setdefault(grid_cell(old_x, old_y), []).append(i)
+    grid.setdefault((cx, cy), []).append(len(clicked_xy))
+    st.session_state.clicked_xy = np.vstack([clicked_xy, (x, y)])
+    st.session_state.clicked_pid.append(st.session_state.next_pid)
+    # A new click becomes the point whose form is shown.
+    st.session_state.active_point = st.session_state.next_pid
+    st.session_state.next_pid += 1
+    return True
 
-# 1. Upload Image
-uploaded_file = st.file_uploader("Choose an image", type=["png", "jpg", "jpeg"])
-if uploaded_file is not None:
-    image = Image.open(uploaded_file)
-    
-    # Button to rotate image by 90 degrees on each click.
-    if st.button("Rotate Image"):
-        st.session_state.rotation_angle = (st.session_state.rotation_angle + 90) % 360
+def add_annotation(**fields):
+    """Append one annotation to every column of the annotation store."""
+    for field, column in st.session_state.annotations.items():
+        column.append(fields[field])
+
+def delete_annotation(ann_id):
+    """Remove the annotation with the given id from every column of the annotation store."""
+    i = st.session_state.annotations["id"].index(ann_id)
+    for column in st.session_state.annotations.values():
+        del column[i]
+
+def clear_all():
+    """Empty the clicked points and annotations in place and restart the id counter."""
+    for column in st.session_state.annotations.values():
+        del column[:]
+    st.session_state.click_grid.clear()
+    st.session_state.clicked_xy = np.empty((0, 2))
+    st.session_state.clicked_pid.clear()
+    st.session_state.next_id = 1
+
+@st.cache_data(ttl=24*60*60, show_spinner=False)
+def load_and_resize(file_bytes, display_width, rotation=0):
+    """Decode, resize and rotate the uploaded image."""
+    image = Image.open(io.BytesIO(file_bytes))
+    # Work out the display size from the rotated shape, but resize first so the
+    # rotation only touches display-sized pixels.
+    quarter_turn = rotation in (90, 270)
+    rotated_width, rotated_height = (image.height, image.width) if quarter_turn else image.size
+    display_ratio = display_width / rotated_width
+    display_height = int(rotated_height * display_ratio)
+    resize_to = (display_height, display_width) if quarter_turn else (display_width, display_height)
+    resized_image = image.resize(resize_to, Image.BILINEAR)
+    # Right-angle rotations are a plain pixel transpose; no interpolation needed.
+    return resized_image.transpose(ROTATE_TRANSPOSE[rotation]) if rotation else resized_image
+
+@st.cache_resource
+def get_annotation_font(size=40):
+    """Load a bold font once per process; if unavailable, fall back to a regular one."""
+    for font_name in ("arialbd.ttf", "arial.ttf", "DejaVuSans-Bold.ttf"):
+        try:
+            return ImageFont.truetype(font_name, size)
+        except Exception:
+            continue
+    st.error("No custom font available; falling back to default font (text may be small).")
+    return ImageFont.load_default()
+
+@st.cache_resource
+def get_glyph_cache(size, fill):
+    """Cache of stroked glyph tiles for one font size and colour: char -> (tile, offset, advance)."""
+    return {}
+
+@functools.lru_cache(maxsize=256)
+def text_bbox(text, size):
+    """Return the font bounding box of text, measuring each distinct string only once."""
+    return get_annotation_font(size).getbbox(text)
+
+def paste_text(image, xy, text, size, fill):
+    """Draw outlined text at xy by pasting cached glyph tiles instead of re-rasterizing them."""
+    glyphs = get_glyph_cache(size, fill)
+    x, y = xy
+    for c in text:
+        if c not in glyphs:
+            # The font is only needed to rasterize a glyph the cache hasn't seen yet.
+            font = get_annotation_font(size)
+            left, top, right, bottom = font.getbbox(c, stroke_width=2)
+            tile = Image.new("RGBA", (max(right - left, 1), max(bottom - top, 1)), (0, 0, 0, 0))
+            ImageDraw.Draw(tile).text((-left, -top), c, fill=fill, font=font, stroke_width=2, stroke_fill="black")
+            glyphs[c] = (tile, (left, top), font.getlength(c))
+        tile, (left, top), advance = glyphs[c]
+        image.paste(tile, (int(round(x + left)), int(round(y + top))), tile)
+        x += advance
+
+@st.cache_resource(max_entries=4)
+def make_base_fig(image_key, _image):
+    """Build the background image figure once per image; callers copy it before filling in the markers."""
+    # Encode the PIL image to a PNG data URI directly; px.imshow would copy it into a NumPy array first.
+    buf = io.BytesIO()
+    _image.save(buf, format="PNG", compress_level=1)
+    fig = go.Figure(go.Image(source="data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")))
+    fig.update_xaxes(range=[-0.5, _image.width - 0.5], constrain="domain")
+    fig.update_yaxes(range=[_image.height - 0.5, -0.5], scaleanchor="x", constrain="domain")
+    fig.update_layout(clickmode='event+select')
+    # Empty marker layer at index 1; each run fills in its own copy. WebGL markers keep
+    # browser redraws fast as the number of points grows.
+    fig.add_trace(go.Scattergl(x=[], y=[], mode="markers", marker=dict(size=12), name="Clicked Points"))
+    return fig
+
+def draw_markers(image, points_xy, is_ann, r=6):
+    """Draw filled marker disks (green if annotated, red otherwise) and return an RGB image."""
+    # Convert first so the red/green markers keep their colour on greyscale uploads.
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for (x, y), annotated in zip(points_xy.tolist(), is_ann):
+        color = "green" if annotated else "red"
+        draw.ellipse([(x - r, y - r), (x + r, y + r)], fill=color, outline=color)
+    return image
+
+@st.cache_data(ttl=24*60*60, show_spinner=False, max_entries=16)
+def render_annotated_png(image_key, _resized_image, ann_rows):
+    """Draw the annotation text onto a copy of the image and return it as PNG bytes."""
+    right_image = _resized_image.copy()
+    # Base font size is 40; glyphs and text boxes are measured once and reused across annotations.
+
+    for x, y, location, value in ann_rows:
+        # For "Stenosis", use a smaller, red X.
+        if location == "Stenosis":
+            text = "X"
+            fill_color = "red"
+        else:
+            text = value
+            fill_color = "#FFFFFF"
+        
+        # Compute text bounding box and center the text at the annotation point.
+        bbox = text_bbox(text, 40)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        x = x - text_width / 2
+        y = y - text_height / 2
+        paste_text(right_image, (x, y), text, 40, fill_color)
     
-    # Rotate the image based on the current session state rotation angle.
-    rotated_image = image.rotate(st.session_state.rotation_angle, expand=True)
+    # Fastest zlib level: a slightly larger download, a much quicker encode.
+    buf_img = io.BytesIO()
+    right_image.save(buf_img, format="PNG", compress_level=1)
+    return buf_img.getvalue()
+
+@st.cache_resource
+def get_table_font(size=18):
+    """Load a regular-weight font for the summary table body once per process."""
+    for font_name in ("arial.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(font_name, size)
+        except Exception:
+            continue
+    return ImageFont.load_default()
+
+@st.cache_data(ttl=24*60*60, show_spinner=False)
+def render_summary_table_png(rows, row_height=36, pad=10):
+    """Draw the (location, pressure) rows as a bordered table with PIL and return PNG bytes."""
+    header_font = get_annotation_font(18)
+    body_font = get_table_font(18)
+    header = ("Location", "Pressure (mmHg)")
+    cells = [tuple(str(v) for v in row) for row in rows]
+    # Size each column to its widest entry.
+    col_widths = [
+        int(max([header_font.getlength(header[j])] + [body_font.getlength(row[j]) for row in cells])) + 2 * pad
+        for j in range(2)
+    ]
+    width, height = sum(col_widths) + 1, row_height * (len(cells) + 1) + 1
+    table_image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(table_image)
+    for i, row in enumerate([header] + cells):
+        top = i * row_height
+        middle = top + row_height // 2
+        left = 0
+        for j, text in enumerate(row):
+            draw.rectangle([left, top, left + col_widths[j], top + row_height], outline="black")
+            # Header centred in bold; body location left-aligned, pressure right-aligned.
+            if i == 0:
+                draw.text((left + col_widths[j] // 2, middle), text, fill="black", font=header_font, anchor="mm")
+            elif j == 0:
+                draw.text((left + pad, middle), text, fill="black", font=body_font, anchor="lm")
+            else:
+                draw.text((left + col_widths[j] - pad, middle), text, fill="black", font=body_font, anchor="rm")
+            left += col_widths[j]
+    buf_table = io.BytesIO()
+    table_image.save(buf_table, format="PNG", compress_level=1)
+    return buf_table.getvalue()
+
+def set_click_markers(fig, is_ann):
+    """Fill the figure's marker layer with every clicked point, green if annotated and red otherwise."""
+    clicked_xy = st.session_state.clicked_xy
+    fig.data[1].update(
+        x=clicked_xy[:, 0],
+        y=clicked_xy[:, 1],
+        marker_color=np.where(is_ann, "green", "red").tolist()
+    )
+
+def rerun_fragment():
+    """Rerun only the calling fragment; during a full-app run, rerun the whole app instead."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+@st.fragment
+def annotation_panel(base_fig, display_width, display_height):
+    """Clickable image plus the active point's annotation form; clicks and edits rerun only this panel."""
+    if "notice" in st.session_state:
+        st.success(st.session_state.pop("notice"))
     
-    # Resize rotated image to a fixed width (e.g., 600px)
-    display_width = 600
-    display_ratio = display_width / rotated_image.width
-    display_height = int(rotated_image.height * display_ratio)
-    resized_image = rotated_image.resize((display_width, display_height))
+    # Annotations only change on save, which reruns the whole app, so this mask holds for the whole panel run.
+    # It is kept in session state so the Generate section later in the same run can reuse it.
+    is_ann = annotated_mask(st.session_state.clicked_xy, coords_array(st.session_state.annotations))
+    st.session_state.is_ann = is_ann
     
-    # Convert the PIL image to a numpy array for Plotly.
-    img_array = np.array(resized_image)
-    
-    # 2. Create a Plotly figure to display the image and capture click events.
-    # Reverse the y-axis so that coordinates match the PIL image.
-    fig = px.imshow(img_array)
-    fig.update_yaxes(autorange='reversed')
-    fig.update_layout(clickmode='event+select')
-    
-    # If there are already clicked points, add them as red markers.
-    if st.session_state.clicked_points:
-        fig.add_scatter(
-            x=[pt["x"] for pt in st.session_state.clicked_points],
-            y=[pt["y"] for pt in st.session_state.clicked_points],
-            mode="markers",
-            marker=dict(size=12, color="red"),
-            name="Clicked Points"
-        )
+    # Copy the cached figure so the markers set below don't end up in the cache.
+    fig = copy.copy(base_fig)
+    set_click_markers(fig, is_ann)
     
     # Capture new click events on the Plotly image.
     new_clicked = plotly_events(
@@ -110,203 +335,164 @@ if uploaded_file is not None:
         override_width=display_width
     )
     if new_clicked:
-        for pt in new_clicked:
-            add_clicked_point({"x": pt.get("x"), "y": pt.get("y")})
+        added = [add_clicked_point({"x": pt.get("x"), "y": pt.get("y")}) for pt in new_clicked]
+        # Redraw just this panel so the new marker shows on the clickable image.
+        if any(added):
+            rerun_fragment()
     
-    # Refresh the Plotly figure with all clicked points.
-    fig.data = []  # clear previous traces
-    fig = px.imshow(img_array)
-    fig.update_yaxes(autorange='reversed')
-    fig.update_layout(clickmode='event+select')
-    if st.session_state.clicked_points:
-        fig.add_scatter(
-            x=[pt["x"] for pt in st.session_state.clicked_points],
-            y=[pt["y"] for pt in st.session_state.clicked_points],
-            mode="markers",
-            marker=dict(size=12, color="red"),
-            name="Clicked Points"
-        )
+    # Any new click reran the panel above, so the same figure already shows every clicked point.
     st.plotly_chart(fig, use_container_width=True)
     
     st.write("Below are forms for adding details to each new annotation (for each point you clicked).")
     
-    # 3. For each clicked point that is not yet annotated, display a form to add annotation details.
-    tolerance = 5
-    for pt in st.session_state.clicked_points:
-        already_annotated = any(
-            abs(ann["x"] - pt["x"]) < tolerance and abs(ann["y"] - pt["y"]) < tolerance 
-            for ann in st.session_state.annotations
+    # 3. Display a form to add annotation details for one point that is not yet annotated:
+    # the most recent click, unless another pending point is picked below. Typing into a
+    # field then only rebuilds that one point's widgets, however many points are waiting.
+    # Widget keys use each point's integer id, so they stay the same however the coordinates print.
+    pending = {
+        pid: (pt_x, pt_y)
+        for pid, (pt_x, pt_y), already_annotated in zip(st.session_state.clicked_pid, st.session_state.clicked_xy.tolist(), is_ann)
+        if not already_annotated
+    }
+    if pending:
+        if st.session_state.get("active_point") not in pending:
+            st.session_state.active_point = next(reversed(pending))
+        # The picker's widget state is active_point itself, so a new click re-points it.
+        pid = st.selectbox(
+            "Point to annotate:",
+            list(pending),
+            format_func=lambda p: f"(x={pending[p][0]:.0f}, y={pending[p][1]:.0f})",
+            key="active_point"
         )
-        if not already_annotated:
-            with st.expander(f"Add Annotation at (x={pt['x']:.0f}, y={pt['y']:.0f})"):
-                location = st.selectbox("Select location:", LOCATIONS, key=f"loc_{pt['x']}_{pt['y']}")
-                # Initialize side as "Select..." for later use if needed.
-                side = "Select..."
-                if location in SIDE_REQUIRED:
-                    side = st.selectbox("Select side:", ["Select...", "Left", "Right"], key=f"side_{pt['x']}_{pt['y']}")
-                
-                # For "Stenosis", we don't prompt for pressure input; we add a big X instead.
-                if location != "Select...":
-                    if location == "Stenosis":
-                        annotation_value = "X"
-                    else:
-                        annotation_value = st.text_input("Enter pressure value (mmHg):", key=f"val_{pt['x']}_{pt['y']}")
+        pt_x, pt_y = pending[pid]
+        with st.expander(f"Add Annotation at (x={pt_x:.0f}, y={pt_y:.0f})"):
+            location = st.selectbox("Select location:", LOCATIONS, key=f"loc_{pid}")
+            # Initialize side as "Select..." for later use if needed.
+            side = "Select..."
+            if location in SIDE_REQUIRED:
+                side = st.selectbox("Select side:", ["Select...", "Left", "Right"], key=f"side_{pid}")
+            
+            # For "Stenosis", we don't prompt for pressure input; we add a big X instead.
+            if location != "Select...":
+                if location == "Stenosis":
+                    annotation_value = "X"
                 else:
-                    annotation_value = ""
-                
-                # Save annotation only if location is selected and (if required) side is selected.
-                if location != "Select..." and st.button("Save Annotation", key=f"save_{pt['x']}_{pt['y']}"):
-                    if location in SIDE_REQUIRED and side == "Select...":
-                        st.error("Please select a side (Left or Right) for this location.")
-                    else:
-                        annotation = {
-                            "id": st.session_state.next_id,
-                            "x": pt["x"],
-                            "y": pt["y"],
-                            "location": location,
-                            "value": annotation_value
-                        }
-                        # Save sidedness only for the table.
-                        if location in SIDE_REQUIRED:
-                            annotation["side"] = side
-                        st.session_state.annotations.append(annotation)
-                        st.session_state.next_id += 1
-                        st.success(f"Annotation {annotation['id']} added!")
+                    annotation_value = st.text_input("Enter pressure value (mmHg):", key=f"val_{pid}")
+            else:
+                annotation_value = ""
+            
+            # Save annotation only if location is selected and (if required) side is selected.
+            if location != "Select..." and st.button("Save Annotation", key=f"save_{pid}"):
+                if location in SIDE_REQUIRED and side == "Select...":
+                    st.error("Please select a side (Left or Right) for this location.")
+                else:
+                    ann_id = st.session_state.next_id
+                    # Save sidedness only for the table.
+                    add_annotation(
+                        id=ann_id,
+                        x=pt_x,
+                        y=pt_y,
+                        location=location,
+                        value=annotation_value,
+                        side=side if location in SIDE_REQUIRED else ""
+                    )
+                    st.session_state.next_id += 1
+                    st.session_state.notice = f"Annotation {ann_id} added!"
+                    # Rerun the whole app so the sidebar and Generate section see the new annotation.
+                    st.rerun()
+
+@st.fragment
+def sidebar_panel():
+    """Annotation list with delete buttons; call inside `with st.sidebar:`."""
+    st.title("Annotations")
+    if st.button("Clear all"):
+        clear_all()
+        st.session_state.sidebar_notice = "All points and annotations cleared!"
+        # Clicked points live in the image panel too, so rerun the whole app.
+        st.rerun()
+    if "sidebar_notice" in st.session_state:
+        st.success(st.session_state.pop("sidebar_notice"))
+    annotations = st.session_state.annotations
+    if annotations["id"]:
+        # No copy needed: a delete reruns straight away, so the loop never sees the shortened columns.
+        for ann_id, location, side, value in zip(annotations["id"], annotations["location"], annotations["side"], annotations["value"]):
+            extra = f" - {side}" if side else ""
+            st.write(f"ID {ann_id}: {location}{extra} - {value}")
+            if st.button("Delete", key=f"delete_{ann_id}"):
+                delete_annotation(ann_id)
+                st.session_state.sidebar_notice = f"Annotation {ann_id} deleted!"
+                rerun_fragment()
+    else:
+        st.write("No annotations yet.")
+
+# 1. Upload Image
+uploaded_file = st.file_uploader("Choose an image", type=["png", "jpg", "jpeg"])
+if uploaded_file is not None:
+    # Button to rotate image by 90 degrees on each click.
+    if st.button("Rotate Image"):
+        st.session_state.rotation_angle = (st.session_state.rotation_angle + 90) % 360
+    
+    # Rotate the image based on the current session state rotation angle and resize
+    # it to a fixed width (e.g., 600px); reruns reuse the cached result.
+    display_width = 600
+    file_bytes = uploaded_file.getvalue()
+    resized_image = load_and_resize(file_bytes, display_width, st.session_state.rotation_angle)
+    display_height = resized_image.height
+    
+    # 2. Create a Plotly figure to display the image and capture click events.
+    # Reverse the y-axis so that coordinates match the PIL image.
+    # The base figure is cached per image and the panel below copies it.
+    image_key = (hash(file_bytes), display_width, st.session_state.rotation_angle)
+    base_fig = make_base_fig(image_key, resized_image)
+    annotation_panel(base_fig, display_width, display_height)
     
     # 4. Display current annotations in the sidebar with delete options.
-    st.sidebar.title("Annotations")
-    if st.session_state.annotations:
-        for ann in st.session_state.annotations.copy():
-            extra = f" - {ann['side']}" if "side" in ann else ""
-            st.sidebar.write(f"ID {ann['id']}: {ann['location']}{extra} - {ann['value']}")
-            if st.sidebar.button("Delete", key=f"delete_{ann['id']}"):
-                st.session_state.annotations = [a for a in st.session_state.annotations if a["id"] != ann["id"]]
-                st.sidebar.success(f"Annotation {ann['id']} deleted!")
-    else:
-        st.sidebar.write("No annotations yet.")
+    with st.sidebar:
+        sidebar_panel()
     
     # 5. Generate and display side by side:
     #    - Left: The original image (the one you clicked on) with drawn markers.
     #    - Right: The annotated image with large text drawn.
     if st.button("Generate and Save Annotated Image"):
-        # Left image: Draw markers (red if unannotated, green if annotated) on a copy of the original resized image.
-        left_image = resized_image.copy()
-        draw_left = ImageDraw.Draw(left_image)
-        r = 6  # marker radius
-        tolerance = 5
-        for pt in st.session_state.clicked_points:
-            annotated = any(
-                abs(ann["x"] - pt["x"]) < tolerance and abs(ann["y"] - pt["y"]) < tolerance 
-                for ann in st.session_state.annotations
-            )
-            color = "green" if annotated else "red"
-            draw_left.ellipse(
-                [(pt["x"] - r, pt["y"] - r), (pt["x"] + r, pt["y"] + r)],
-                fill=color,
-                outline=color
-            )
-        
-        # Right image: Draw the annotation text onto a copy of the original image.
-        right_image = resized_image.copy()
-        draw_right = ImageDraw.Draw(right_image)
-        # Try to use a bold font; if unavailable, fall back to a regular one. Base font size is 40.
-        try:
-            base_font = ImageFont.truetype("arialbd.ttf", 40)
-        except Exception as e1:
-            try:
-                base_font = ImageFont.truetype("arial.ttf", 40)
-            except Exception as e2:
-                try:
-                    base_font = ImageFont.truetype("DejaVuSans-Bold.ttf", 40)
-                except Exception as e3:
-                    st.error("No custom font available; falling back to default font (text may be small).")
-                    base_font = ImageFont.load_default()
-
-        for ann in st.session_state.annotations:
-            # For "Stenosis", use a smaller, red X.
-            if ann["location"] == "Stenosis":
-                text = "X"
-                try:
-                    font = ImageFont.truetype("arialbd.ttf", 40)  # half the original 80
-                except Exception as e1:
-                    try:
-                        font = ImageFont.truetype("arial.ttf", 40)
-                    except Exception as e2:
-                        try:
-                            font = ImageFont.truetype("DejaVuSans-Bold.ttf", 40)
-                        except Exception as e3:
-                            font = ImageFont.load_default()
-                fill_color = "red"
-            else:
-                text = ann["value"]
-                font = base_font
-                fill_color = "#FFFFFF"
+        annotations = st.session_state.annotations
+        ann_rows = tuple(zip(annotations["x"], annotations["y"], annotations["location"], annotations["value"]))
+        # Pressing Generate again with the same image, annotations and clicks re-displays
+        # the last result instead of redrawing it.
+        gen_key = (image_key, tuple(map(tuple, annotations.values())), tuple(st.session_state.clicked_pid))
+        last = st.session_state.get("last_generated")
+        if last is not None and last[0] == gen_key:
+            _, left_image_bytes, annotated_image_bytes, table_png = last
+        else:
+            # Right image: the annotated PNG is cached per image and annotation list,
+            # so pressing Generate again without edits skips the redraw and encode.
+            annotated_image_bytes = render_annotated_png(image_key, resized_image, ann_rows)
             
-            # Compute text bounding box and center the text at the annotation point.
-            bbox = font.getbbox(text)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            x = ann["x"] - text_width / 2
-            y = ann["y"] - text_height / 2
-            draw_right.text(
-                (x, y),
-                text,
-                fill=fill_color,
-                font=font,
-                stroke_width=2,
-                stroke_fill="black"
+            # Left image: markers (red if unannotated, green if annotated) drawn onto this run's copy.
+            # Reuse the mask the annotation panel computed earlier in this run.
+            left_image = draw_markers(resized_image, st.session_state.clicked_xy, st.session_state.is_ann)
+            buf_left = io.BytesIO()
+            left_image.save(buf_left, format="PNG", compress_level=1)
+            left_image_bytes = buf_left.getvalue()
+            
+            # Generate a summary table with only pressure measurements.
+            # One pass over the columns skips "Stenosis" and combines sidedness into the
+            # location where one was chosen, collecting only the rows that are kept.
+            summary_rows = tuple(
+                (f"{side} {location}".strip() if side and side != "Select..." else location, value)
+                for location, side, value in zip(annotations["location"], annotations["side"], annotations["value"])
+                if location != "Stenosis"
             )
-
+            
+            # The table PNG is cached on its rows, so unchanged annotations skip the redraw.
+            table_png = render_summary_table_png(summary_rows)
+            st.session_state.last_generated = (gen_key, left_image_bytes, annotated_image_bytes, table_png)
+        
         # Display the two images side by side using columns.
         col1, col2 = st.columns(2)
         with col1:
-            st.image(left_image, caption="Original Image (with markers)", use_container_width=True)
+            st.image(left_image_bytes, caption="Original Image (with markers)", use_container_width=True)
         with col2:
-            st.image(right_image, caption="Annotated Image (with large text)", use_container_width=True)
-        
-        # Save the annotated image to bytes for download.
-        buf_img = io.BytesIO()
-        right_image.save(buf_img, format="PNG")
-        annotated_image_bytes = buf_img.getvalue()
-        
-        # Generate a summary table with only pressure measurements.
-        df_full = pd.DataFrame(st.session_state.annotations)
-        if not df_full.empty:
-            # Exclude annotations for "Stenosis" from the table.
-            df_summary = df_full[~df_full["location"].isin(["Stenosis"])].copy()
-            # Fill missing sidedness with empty strings to avoid "nan"
-            if "side" in df_summary.columns:
-                df_summary["side"] = df_summary["side"].fillna("")
-            # Combine sidedness into the location if applicable.
-            df_summary["location"] = df_summary.apply(
-                lambda row: f"{row['side']} {row['location']}".strip() if row.get("side", "") and row["side"] != "Select..." else row["location"],
-                axis=1
-            )
-            df_summary = df_summary[["location", "value"]]
-        else:
-            df_summary = pd.DataFrame(columns=["location", "value"])
-        
-        fig_table, ax = plt.subplots(figsize=(6, len(df_summary) * 0.5 + 1))
-        ax.axis('tight')
-        ax.axis('off')
-        table = ax.table(
-            cellText=df_summary.values,
-            colLabels=["Location", "Pressure (mmHg)"],
-            loc='center'
-        )
-        for (i, j), cell in table.get_celld().items():
-            if i == 0:
-                cell.set_text_props(weight='bold', ha='center')
-            else:
-                if j == 0:
-                    cell.set_text_props(ha='left')
-                elif j == 1:
-                    cell.set_text_props(ha='right')
-        plt.tight_layout()
-        buf_table = io.BytesIO()
-        plt.savefig(buf_table, format="PNG")
-        buf_table.seek(0)
-        table_png = buf_table.getvalue()
+            st.image(annotated_image_bytes, caption="Annotated Image (with large text)", use_container_width=True)
         
         st.download_button("Download Annotated Image", data=annotated_image_bytes,
                            file_name="annotated_image.png", mime="image/png")
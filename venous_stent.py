@@ -1,8 +1,6 @@
 import streamlit as st
 from streamlit_drawable_canvas import st_canvas
 from PIL import Image, ImageDraw, ImageFont
-import pandas as pd
-import matplotlib.pyplot as plt
 import io
 
 st.title("Venous Pressure Annotation App")
@@ -29,15 +27,109 @@ LOCATIONS = [
     "Occlusion"
 ]
 
+# Two coordinates closer than this many pixels (in both x and y) are the same point.
+TOLERANCE = 5
+
+def grid_cell(x, y):
+    """Return the TOLERANCE-sized grid cell that holds the point (x, y)."""
+    return int(x // TOLERANCE), int(y // TOLERANCE)
+
+def add_to_grid(grid, ann):
+    """Bucket an annotation into its grid cell."""
+    grid.setdefault(grid_cell(ann["x"], ann["y"]), []).append(ann)
+
+def find_annotation(grid, x, y):
+    """Return an annotation within the tolerance of (x, y), or None; only the 3x3 neighbouring cells can hold one."""
+    cx, cy = grid_cell(x, y)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for ann in grid.get((cx + dx, cy + dy), ()):
+                if abs(ann["x"] - x) < TOLERANCE and abs(ann["y"] - y) < TOLERANCE:
+                    return ann
+    return None
+
+@st.cache_data(ttl=24*60*60, show_spinner=False)
+def load_and_resize(file_bytes, display_width):
+    """Decode and resize the uploaded image, as RGB for the canvas background."""
+    image = Image.open(io.BytesIO(file_bytes))
+    display_ratio = display_width / image.width
+    display_height = int(image.height * display_ratio)
+    resized_image = image.resize((display_width, display_height))
+    # Convert once here (after shrinking) so the canvas gets a plain RGB image it can ship
+    # without per-rerun mode conversion or a larger alpha-channel encoding.
+    return resized_image if resized_image.mode == "RGB" else resized_image.convert("RGB")
+
+@st.cache_resource
+def get_annotation_font(size=24):
+    """Load the annotation font once per process; if unavailable, fall back to the default one."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except Exception:
+        return ImageFont.load_default()
+
+@st.cache_data(ttl=24*60*60, show_spinner=False)
+def render_annotated_png(file_bytes, display_width, ann_rows):
+    """Draw the (x, y, value) annotations on the resized image and return PNG bytes."""
+    # load_and_resize hands back its own copy, so it can be annotated in place.
+    annotated_image = load_and_resize(file_bytes, display_width)
+    draw = ImageDraw.Draw(annotated_image)
+    font = get_annotation_font(24)
+    
+    # Draw each annotation on the image using only the pressure value (or OCL)
+    for x, y, text in ann_rows:  # Do not include the ID in the final image
+        offset = (5, -5)
+        draw.text(
+            (x + offset[0], y + offset[1]),
+            text,
+            fill="#FFFFFF",    # Darker red
+            font=font,
+            stroke_width=2,    # Thicker text outline
+            stroke_fill="black"
+        )
+    
+    buf_img = io.BytesIO()
+    annotated_image.save(buf_img, format="PNG", compress_level=1)
+    return buf_img.getvalue()
+
+@st.cache_data(ttl=24*60*60, show_spinner=False)
+def render_summary_table_png(rows):
+    """Render the (location, pressure) rows as a matplotlib table and return PNG bytes."""
+    # Import matplotlib only when a table actually has to be drawn; Agg skips GUI backend probing.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    
+    fig = plt.figure(figsize=(6, len(rows)*0.5 + 1))
+    ax = fig.add_axes([0.02, 0.02, 0.96, 0.96])
+    ax.axis('off')
+    table = ax.table(
+        cellText=[list(row) for row in rows],
+        colLabels=["Location", "Pressure (mmHg)"],
+        loc='center'
+    )
+    # Format table: left-align location, right-align pressure
+    for (i, j), cell in table.get_celld().items():
+        if i == 0:
+            cell.set_text_props(weight='bold', ha='center')
+        else:
+            if j == 0:
+                cell.set_text_props(ha='left')
+            elif j == 1:
+                cell.set_text_props(ha='right')
+    buf_table = io.BytesIO()
+    fig.savefig(buf_table, format="PNG", dpi=100, bbox_inches=None,
+                pil_kwargs={"compress_level": 1})
+    # Close the figure so pyplot does not keep every generated table alive.
+    plt.close(fig)
+    return buf_table.getvalue()
+
 # 1. Upload Image
 uploaded_file = st.file_uploader("Choose an image", type=["png", "jpg", "jpeg"])
 if uploaded_file is not None:
-    image = Image.open(uploaded_file)
-    # Resize image to a fixed width (e.g., 600px) to reduce scrolling
+    # Resize image to a fixed width (e.g., 600px) to reduce scrolling; reruns reuse the cached result.
     display_width = 600
-    display_ratio = display_width / image.width
-    display_height = int(image.height * display_ratio)
-    resized_image = image.resize((display_width, display_height))
+    resized_image = load_and_resize(uploaded_file.getvalue(), display_width)
+    display_height = resized_image.height
     st.image(resized_image, caption="Uploaded Image", width=display_width)
     
     # 2. Create a drawing canvas overlay on the resized image
@@ -58,17 +150,33 @@ if uploaded_file is not None:
         st.session_state.annotations = []
     if "next_id" not in st.session_state:
         st.session_state.next_id = 1
+    if "matched_objects" not in st.session_state:
+        st.session_state.matched_objects = {}  # (left, top) of a canvas point -> id of its annotation
 
     # 3. Process canvas clicks: add an annotation for each new point
     if canvas_result.json_data is not None:
         objects = canvas_result.json_data.get("objects", [])
+        # Points already matched to a live annotation are skipped outright; the grid for
+        # the tolerance check is only built once some point actually needs it.
+        live_ids = {ann["id"] for ann in st.session_state.annotations}
+        matched = st.session_state.matched_objects
+        grid = None
         for obj in objects:
             if obj.get("type") == "circle":
                 x = obj.get("left")
                 y = obj.get("top")
+                if matched.get((x, y)) in live_ids:
+                    continue
+                if grid is None:
+                    # Bucket the annotations so each point check is a constant-time neighbour lookup.
+                    grid = {}
+                    for ann in st.session_state.annotations:
+                        add_to_grid(grid, ann)
                 # Check if this point is already annotated (tolerance: 5 pixels)
-                exists = any(abs(ann["x"] - x) < 5 and abs(ann["y"] - y) < 5 for ann in st.session_state.annotations)
-                if not exists:
+                existing = find_annotation(grid, x, y)
+                if existing is not None:
+                    matched[(x, y)] = existing["id"]
+                else:
                     st.write(f"New annotation at (x={x:.0f}, y={y:.0f}):")
                     location = st.selectbox(
                         "Select location:",
@@ -92,79 +200,42 @@ if uploaded_file is not None:
                                 "value": annotation_value
                             }
                             st.session_state.annotations.append(annotation)
+                            add_to_grid(grid, annotation)
+                            matched[(x, y)] = annotation["id"]
                             st.session_state.next_id += 1
                             st.success(f"Annotation {annotation['id']} added!")
     
     # 4. Display current annotations in the sidebar with delete options
     st.sidebar.title("Annotations")
     if st.session_state.annotations:
-        for ann in st.session_state.annotations.copy():
+        for i, ann in enumerate(st.session_state.annotations):
             st.sidebar.write(f"ID {ann['id']}: {ann['location']} - {ann['value']}")
             if st.sidebar.button("Delete", key=f"delete_{ann['id']}"):
-                st.session_state.annotations = [a for a in st.session_state.annotations if a["id"] != ann["id"]]
+                # Safe to pop mid-loop: the rerun below ends this pass.
+                st.session_state.annotations.pop(i)
                 st.sidebar.success(f"Annotation {ann['id']} deleted!")
-                st.experimental_rerun()
+                st.rerun()
     else:
         st.sidebar.write("No annotations yet.")
     
     # 5. Generate annotated image and summary table as PNG for download
     if st.button("Generate and Save Annotated Image"):
-        # Annotate the image (using the resized version)
-        annotated_image = resized_image.copy()
-        draw = ImageDraw.Draw(annotated_image)
-        try:
-            font = ImageFont.truetype("arial.ttf", 24)
-        except Exception as e:
-            font = ImageFont.load_default()
-        
-        # Draw each annotation on the image using only the pressure value (or OCL)
-        for ann in st.session_state.annotations:
-            text = ann["value"]  # Do not include the ID in the final image
-            offset = (5, -5)
-            draw.text(
-                (ann["x"] + offset[0], ann["y"] + offset[1]),
-                text,
-                fill="#FFFFFF",    # Darker red
-                font=font,
-                stroke_width=2,    # Thicker text outline
-                stroke_fill="black"
-            )
-        
-        buf_img = io.BytesIO()
-        annotated_image.save(buf_img, format="PNG")
-        annotated_image_bytes = buf_img.getvalue()
+        # The annotated PNG is cached per upload and annotation list, so pressing
+        # Generate again without edits skips the redraw and encode.
+        ann_rows = tuple((ann["x"], ann["y"], ann["value"]) for ann in st.session_state.annotations)
+        annotated_image_bytes = render_annotated_png(uploaded_file.getvalue(), display_width, ann_rows)
         
         # Create a summary table with only location and pressure (mmHg)
-        # Exclude rows where location is "Occlusion"
-        df_full = pd.DataFrame(st.session_state.annotations)
-        if not df_full.empty:
-            df_summary = df_full[df_full["location"] != "Occlusion"][["location", "value"]]
-        else:
-            df_summary = pd.DataFrame(columns=["location", "value"])
-        
-        # Generate a PNG image of the summary table using matplotlib
-        fig, ax = plt.subplots(figsize=(6, len(df_summary)*0.5 + 1))
-        ax.axis('tight')
-        ax.axis('off')
-        table = ax.table(
-            cellText=df_summary.values,
-            colLabels=["Location", "Pressure (mmHg)"],
-            loc='center'
+        # Exclude rows where location is "Occlusion"; only the kept rows are collected.
+        summary_rows = tuple(
+            (ann["location"], ann["value"])
+            for ann in st.session_state.annotations
+            if ann["location"] != "Occlusion"
         )
-        # Format table: left-align location, right-align pressure
-        for (i, j), cell in table.get_celld().items():
-            if i == 0:
-                cell.set_text_props(weight='bold', ha='center')
-            else:
-                if j == 0:
-                    cell.set_text_props(ha='left')
-                elif j == 1:
-                    cell.set_text_props(ha='right')
-        plt.tight_layout()
-        buf_table = io.BytesIO()
-        plt.savefig(buf_table, format="PNG")
-        buf_table.seek(0)
-        table_png = buf_table.getvalue()
+        
+        # Generate a PNG image of the summary table; it is cached on its rows, so
+        # pressing Generate again without edits skips matplotlib entirely.
+        table_png = render_summary_table_png(summary_rows)
         
         st.download_button("Download Annotated Image", data=annotated_image_bytes, file_name="annotated_image.png", mime="image/png")
         st.download_button("Download Summary Table (PNG)", data=table_png, file_name="summary_table.png", mime="image/png")